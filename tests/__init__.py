@@ -0,0 +1 @@
+"""Tests for wp2tt."""
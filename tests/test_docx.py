@@ -0,0 +1,36 @@
+"""Tests for wp2tt.docx."""
+from pathlib import Path
+import zipfile
+
+import pytest
+
+from wp2tt.docx import DocxInput
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def make_docx(path: Path, body: str) -> Path:
+    """Write a minimal .docx with the given <w:body> contents."""
+    with zipfile.ZipFile(path, "w") as zfo:
+        zfo.writestr(
+            "word/document.xml",
+            f'<w:document xmlns:w="{W}"><w:body>{body}</w:body></w:document>',
+        )
+    return path
+
+
+@pytest.mark.parametrize(
+    ("body", "has_rtl"),
+    [
+        pytest.param("<w:p><w:r><w:t>Hello</w:t></w:r></w:p>", False, id="ltr"),
+        pytest.param(
+            "<w:p><w:r><w:rPr><w:rtl/></w:rPr><w:t>Shalom</w:t></w:r></w:p>",
+            True,
+            id="rtl-run",
+        ),
+    ],
+)
+def test_has_rtl(tmp_path: Path, body: str, *, has_rtl: bool) -> None:
+    """Report right-to-left runs anywhere in the document."""
+    with DocxInput(make_docx(tmp_path / "doc.docx", body)) as doc:
+        assert doc.properties.has_rtl is has_rtl
@@ -0,0 +1,129 @@
+"""Tests for wp2tt.ini."""
+import configparser
+import io
+from pathlib import Path
+
+import pytest
+
+from wp2tt.ini import SettingsFile
+from wp2tt.ini import parse_ini
+
+
+def configparser_sections(text: str) -> dict[str, dict[str, str]]:
+    """Parse with the real thing, for reference."""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_string(text)
+    return as_dict(parser)
+
+
+def fast_sections(text: str) -> dict[str, dict[str, str]]:
+    """Parse with `parse_ini()`, loaded the way `SettingsFile` does it."""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_dict(parse_ini(text))
+    return as_dict(parser)
+
+
+def as_dict(parser: configparser.ConfigParser) -> dict[str, dict[str, str]]:
+    """Flatten a parser, including the defaults."""
+    sections = {name: dict(parser.items(name, raw=True)) for name in parser}
+    sections[parser.default_section] = dict(parser.defaults())
+    return sections
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        pytest.param(
+            "[Style]\nName = Body\nColor: red\n",
+            id="delimiters",
+        ),
+        pytest.param(
+            "[Style]\nMixed Case Key = Value\n",
+            id="lowercase-keys",
+        ),
+        pytest.param(
+            "[Style]\nlong = first\n  second\n\n  third\nnext = x\n",
+            id="continuation",
+        ),
+        pytest.param(
+            "[Style]\nlong = first\n\n\n[Other]\nkey = value\n",
+            id="trailing-empty-lines",
+        ),
+        pytest.param(
+            "# Top\n[Style]\n; Semicolon\nkey = value # not a comment\n"
+            "  # Not a continuation either\n",
+            id="comments",
+        ),
+        pytest.param(
+            "[DEFAULT]\nshared = yes\n[Style]\nkey = value\n[DEFAULT]\nmore = no\n",
+            id="default",
+        ),
+        pytest.param(
+            "[Style]\nempty =\nspaced   =   value  \n",
+            id="empty-and-spaced",
+        ),
+        pytest.param(
+            "  [Indented]\n  key = value\n    more\n",
+            id="indented",
+        ),
+    ],
+)
+def test_same_as_configparser(text: str) -> None:
+    """Parse the same way as `configparser.ConfigParser`."""
+    assert fast_sections(text) == configparser_sections(text)
+
+
+@pytest.mark.parametrize(
+    ("text", "error"),
+    [
+        pytest.param(
+            "[Style]\na = 1\n[Style]\nb = 2\n",
+            configparser.DuplicateSectionError,
+            id="duplicate-section",
+        ),
+        pytest.param(
+            "[Style]\nkey = 1\nKEY = 2\n",
+            configparser.DuplicateOptionError,
+            id="duplicate-key",
+        ),
+        pytest.param(
+            "key = value\n",
+            configparser.MissingSectionHeaderError,
+            id="no-section",
+        ),
+        pytest.param(
+            "[Style]\nno delimiter\n",
+            configparser.ParsingError,
+            id="no-delimiter",
+        ),
+        pytest.param(
+            "[Style]\n= value\n",
+            configparser.ParsingError,
+            id="no-key",
+        ),
+    ],
+)
+def test_same_errors_as_configparser(
+    text: str, error: type[configparser.Error],
+) -> None:
+    """Reject the same files as `configparser.ConfigParser`."""
+    with pytest.raises(error):
+        configparser_sections(text)
+    with pytest.raises(error):
+        parse_ini(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        pytest.param("[A]\nkey = value\nlong = one\n  two\n[B]\n", id="sections"),
+        pytest.param("[DEFAULT]\nshared = yes\n[A]\nkey = value\n", id="default"),
+    ],
+)
+def test_dumps_same_as_write(tmp_path: Path, text: str) -> None:
+    """Write the same text as `configparser.ConfigParser.write()`."""
+    settings = SettingsFile(tmp_path / "settings.ini", fresh_start=True)
+    settings.read_string(text)
+    expected = io.StringIO()
+    settings.write(expected)
+    assert settings.dumps() == expected.getvalue()
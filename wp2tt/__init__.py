@@ -2,11 +2,15 @@
 """Convert word processor files (.docx, .odt) to InDesign's Tagged Text."""
 import argparse
 import collections
+import concurrent.futures
 import contextlib
 import dataclasses as dcl
 from datetime import datetime
+import functools
+import glob
 import itertools
 import logging
+import multiprocessing
 import os
 from pathlib import Path
 import re
@@ -15,8 +19,6 @@ import shutil
 import subprocess
 import typing as t
 
-import cairosvg
-
 from wp2tt.cache import Cache
 from wp2tt.format import ManualFormat
 from wp2tt.ini import SettingsFile
@@ -28,24 +30,36 @@ from wp2tt.input import IDocumentInput
 from wp2tt.input import IDocumentParagraph
 from wp2tt.input import IDocumentSpan
 from wp2tt.input import IDocumentTable
-from wp2tt.mathml import MathConverter
 from wp2tt.output import IOutput
 from wp2tt.output import WhitespaceStripper
-from wp2tt.proxies import ByExtensionInput
-from wp2tt.proxies import MultiInput
-from wp2tt.proxies import ProxyInput
 from wp2tt.styles import OptionalStyle
 from wp2tt.styles import Rule
 from wp2tt.styles import Style
 from wp2tt.tagged_text import InDesignTaggedTextOutput
 from wp2tt.usage import Wp2ttParser
 
+_INI_REF_RE = re.compile(r"\[(?:(?P<realm>\w+):)?(?P<internal_name>.*?)\]")
+_RULE_SECTION_RE = re.compile(r"rule:(?P<description>.*)", re.IGNORECASE)
+_NAMED_FORMATS = tuple((f, f.name) for f in ManualFormat if f.name)
+
 
 def main() -> None:
     """Entry point."""
     WordProcessorToInDesignTaggedText().run()
 
 
+@functools.cache
+def _fmt_name(fmt: ManualFormat) -> str:
+    """Return the style name suffix for a (nonzero) combination of flags."""
+    return "_".join(name for f, name in _NAMED_FORMATS if fmt & f)
+
+
+@functools.cache
+def _emf2svg_conv() -> str:
+    """Return the full path of `emf2svg-conv`, so PATH is searched only once."""
+    return shutil.which("emf2svg-conv") or "emf2svg-conv"
+
+
 class StopMarkerFoundError(Exception):
     """We raise this to stop the presses."""
 
@@ -62,7 +76,7 @@ class ManualFormatCustomStyle:
     unadorned: str | None
 
 
-@dcl.dataclass
+@dcl.dataclass(slots=True)
 class State:
     """Context of styles."""
 
@@ -91,17 +105,15 @@ class WordProcessorToInDesignTaggedText:
     IGNORED_STYLES: t.Mapping[str, list[str]] = {
         "character": ["annotation reference"],
     }
-    STYLE_OVERRIDE: t.Mapping = {
-        "character": {
-            COMMENT_REF_STYLE: {
-                "idtt": "<pShadingColor:Cyan><pShadingOn:1><pShadingTint:100>",
-            },
+    WRITE_SLICE_SIZE = 1 << 20
+    FORMULAS_BEFORE_POOL = 16  # Rendered in-process; workers take a while to start
+    STYLE_OVERRIDE: t.Mapping[tuple[str, str], t.Mapping[str, str]] = {
+        ("character", COMMENT_REF_STYLE): {
+            "idtt": "<pShadingColor:Cyan><pShadingOn:1><pShadingTint:100>",
         },
-        "paragraph": {
-            "annotation text": {
-                "name": SPECIAL_GROUP + "/(Comment Text)",
-                "idtt": "<cSize:6><cColor:Cyan><cColorTint:100>",
-            },
+        ("paragraph", "annotation text"): {
+            "name": SPECIAL_GROUP + "/(Comment Text)",
+            "idtt": "<cSize:6><cColor:Cyan><cColorTint:100>",
         },
     }
 
@@ -109,15 +121,22 @@ class WordProcessorToInDesignTaggedText:
     base_names: dict[str, str]
     base_styles: dict[str, Style]
     cache: Cache
+    chunk_converters: dict[type, t.Callable[[t.Any], None]]
     comment_style: Style
     comment_ref_style: Style
     config: t.Mapping[str, str]
     doc: IDocumentInput
     footnote_ref_style: Style
     format_mask: ManualFormat
+    formula_jobs: concurrent.futures.Executor | None = None
+    formulas_rendered: int = 0
     formula_style: Style
     image_count = itertools.count(1)
     image_dir: Path
+    image_dir_created: bool = False
+    image_jobs: concurrent.futures.Executor
+    image_jobs_by_key: dict[Path, concurrent.futures.Future]
+    image_jobs_started: list[concurrent.futures.Future]
     image_style: Style
     manual_styles: dict[ManualFormatCustomStyle, Style]
     output_dir: Path
@@ -126,13 +145,15 @@ class WordProcessorToInDesignTaggedText:
     parser: Wp2ttParser
     rerunner_fn: Path
     rules: list[Rule]
+    rules_by_style: dict[int, tuple[Rule, ...]]  # By id(style), like `is`
     settings: SettingsFile
     settings_fn: Path
     state: State = State()
     stop_marker: str
     stop_marker_found: bool
     style_sections_used: set[str]
-    styles: dict[str, Style]
+    styles: dict[tuple[str, str], Style]  # By (realm, wpid), as docx refers to them
+    styles_by_name: dict[tuple[str, str], Style]
     table_paragraph_style: Style
     writer: IOutput
 
@@ -164,10 +185,11 @@ class WordProcessorToInDesignTaggedText:
         self.stop_marker = self.args.stop_at
         self.format_mask = ~ManualFormat[self.args.direction]
 
+        hardlink = self.args.cache_mode == "hardlink"
         if self.args.cache:
-            self.cache = Cache(self.args.cache)
+            self.cache = Cache(self.args.cache, hardlink=hardlink)
         elif not self.args.no_cache:
-            self.cache = Cache(self.output_dir / "cache")
+            self.cache = Cache(self.output_dir / "cache", hardlink=hardlink)
         else:
             self.cache = Cache()
 
@@ -198,13 +220,13 @@ class WordProcessorToInDesignTaggedText:
         """Convert Rule sections into Rule objects."""
         self.rules = []
         for section_name in self.settings.sections():
-            if not section_name.lower().startswith("rule:"):
+            if not (mobj := _RULE_SECTION_RE.match(section_name)):
                 continue
             section = self.settings[section_name]
             self.rules.append(
                 Rule(
                     mnemonic=f"R{len(self.rules) + 1}",
-                    description=section_name[5:],
+                    description=mobj.group("description"),
                     **{
                         name: section[ini_name]
                         for name, ini_name in self.settings.fields(Rule)
@@ -232,8 +254,12 @@ class WordProcessorToInDesignTaggedText:
         self.link_styles()
         self.link_rules()
 
-    def create_reader(self) -> ProxyInput:
+    def create_reader(self) -> IDocumentInput:
         """Create the approriate document reader object."""
+        # Imported here, since the readers pull in lxml, pandas, etc.
+        from wp2tt.proxies import ByExtensionInput
+        from wp2tt.proxies import MultiInput
+
         inputs = [self.args.input] + (self.args.append or [])
         if not self.args.no_input_rerunner:
             self.consider_input_rerunners(inputs)
@@ -242,34 +268,43 @@ class WordProcessorToInDesignTaggedText:
         return ByExtensionInput(inputs[0], self.args)
 
     def consider_input_rerunners(self, inputs: list[Path]) -> None:
-        """Look for input rerunners and run them."""
-        for path in inputs:
-            rerun = path.with_name(f"{path.name}.rerun")
-            if not rerun.is_file():
-                continue
-            logging.info("%s exists, trying to run it...", rerun)
-            try:
-                subprocess.run([str(rerun.resolve())], check=True)
-            except PermissionError:
-                logging.warning("No permission to run %s", rerun)
-            except subprocess.CalledProcessError as exc:
-                logging.error("%s exited with code %s", rerun, exc.returncode)
-            except OSError as exc:
-                logging.error("Error running %s: %s", rerun, exc)
+        """Look for input rerunners and run them (in parallel)."""
+        procs: list[tuple[Path, subprocess.Popen]] = []
+        # Leaving the stack waits for every child, even if one wait() is interrupted
+        with contextlib.ExitStack() as stack:
+            for path in inputs:
+                rerun = path.with_name(f"{path.name}.rerun")
+                if not rerun.is_file():
+                    continue
+                logging.info("%s exists, trying to run it...", rerun)
+                try:
+                    cmd = [str(rerun.resolve())]
+                    procs.append((rerun, stack.enter_context(subprocess.Popen(cmd))))
+                except PermissionError:
+                    logging.warning("No permission to run %s", rerun)
+                except OSError as exc:
+                    logging.error("Error running %s: %s", rerun, exc)
+            returncodes = [(rerun, proc.wait()) for rerun, proc in procs]
+
+        for rerun, returncode in returncodes:
+            if returncode:
+                logging.error("%s exited with code %s", rerun, returncode)
 
     def scan_style_definitions(self) -> None:
         """Create a Style object for everything in the document."""
         self.styles = {}
+        self.styles_by_name = {}
         self.create_special_styles()
         counts: t.Mapping[str, t.Iterator[int]] = collections.defaultdict(
             lambda: itertools.count(start=1),
         )
+        group = self.SPECIAL_GROUP
+        found_style_definition = self.found_style_definition
         for style_kwargs in self.doc.styles_defined():
             if style_kwargs.get("automatic"):
-                group = self.SPECIAL_GROUP
                 num = next(counts[style_kwargs["realm"]])
                 style_kwargs["name"] = f"{group}/automatic-{num}"
-            self.found_style_definition(**style_kwargs)
+            found_style_definition(**style_kwargs)
 
     def create_special_styles(self) -> None:
         """Add any internal styles (i.e., not imported from the doc)."""
@@ -334,26 +369,26 @@ class WordProcessorToInDesignTaggedText:
 
     def scan_style_mentions(self) -> None:
         """Mark which styles are actually used."""
-        realms = set()
-        for realm, wpid in self.doc.styles_in_use():
-            realms.add(realm)
-            style_key = self.style_key(realm=realm, wpid=wpid)
-            if style_key not in self.styles:
-                logging.debug("Used but not defined? %r", style_key)
-            elif not self.styles[style_key].used:
-                logging.debug("Style used: %r", style_key)
-                self.styles[style_key].used = True
-        if "table" in realms:
+        # Every run of text mentions its style; only look at each one once
+        mentions = dict.fromkeys(self.doc.styles_in_use())
+        for realm, wpid in mentions:
+            style = self.styles.get((realm, wpid)) if wpid is not None else None
+            if style is None:
+                logging.debug("Used but not defined? '%s:%s'", realm, wpid)
+            elif not style.used:
+                logging.debug("Style used: '%s:%s'", realm, wpid)
+                style.used = True
+        if any(realm == "table" for realm, _ in mentions):
             logging.debug("Here be tables")
             self.table_paragraph_style.used = True
 
     def link_styles(self) -> None:
         """Do a sort of alchemy-relationship thing."""
+        style_or_none = self.style_or_none
         for style in self.styles.values():
-            style.parent_style = self.style_or_none(
-                style.realm, style.parent_wpid,
-            )
-            style.next_style = self.style_or_none(style.realm, style.next_wpid)
+            realm = style.realm
+            style.parent_style = style_or_none(realm, style.parent_wpid)
+            style.next_style = style_or_none(realm, style.next_wpid)
 
     def define_styles(self) -> None:
         """Write (partial) style definition section."""
@@ -365,7 +400,7 @@ class WordProcessorToInDesignTaggedText:
         """Given a realm/wpid pair, return our internal Style object."""
         if not wpid:
             return None
-        return self.styles[self.style_key(realm=realm, wpid=wpid)]
+        return self.styles[(realm, wpid)]
 
     def link_rules(self) -> None:
         """Do a sort of alchemy-relationship thing."""
@@ -380,18 +415,25 @@ class WordProcessorToInDesignTaggedText:
                     inherit_from=rule.turn_this_style,
                 )
                 if rule.when_following is not None:
-                    wfs = [
-                        self.find_style_by_ini_ref(ini_ref)
-                        for ini_ref in re.findall(r"\[.*?\]", rule.when_following)
-                    ]
-                    rule.when_following_styles = [
-                        style for style in wfs
-                        if style is not None
-                    ]
+                    rule.when_following_styles = frozenset(
+                        self.find_style_by_name(
+                            mobj["realm"], mobj["internal_name"], ini_ref=mobj[0],
+                        )
+                        for mobj in _INI_REF_RE.finditer(rule.when_following)
+                    )
             except BadReferenceInRuleError:
                 logging.warning("Ignoring rule with bad references: %s", rule)
                 rule.valid = False
 
+        # Per paragraph, only the rules for its style are of interest
+        by_style: dict[int, list[Rule]] = collections.defaultdict(list)
+        for rule in self.rules:
+            if rule.valid and rule.turn_this_style is not None:
+                by_style[id(rule.turn_this_style)].append(rule)
+        self.rules_by_style = {
+            style_id: tuple(rules) for style_id, rules in by_style.items()
+        }
+
     def find_style_by_ini_ref(
         self,
         ini_ref: str | None,
@@ -405,24 +447,38 @@ class WordProcessorToInDesignTaggedText:
                 logging.debug("MISSING REQUIRED SOMETHING")
                 raise BadReferenceInRuleError
             return None
-        mobj = re.match(
-            r"^\[(?P<realm>\w+):(?P<internal_name>.+)\]$", ini_ref, re.IGNORECASE,
+        # The syntax is simply "[realm:internal_name]"
+        realm, colon, internal_name = ini_ref.removeprefix("[").partition(":")
+        if not (
+            ini_ref.startswith("[")
+            and internal_name.endswith("]")
+            and colon
+            and realm.replace("_", "").isalnum()
+        ):
+            logging.debug("Malformed %r", ini_ref)
+            raise BadReferenceInRuleError
+        return self.find_style_by_name(
+            realm, internal_name[:-1], ini_ref=ini_ref, inherit_from=inherit_from,
         )
-        if not mobj:
+
+    def find_style_by_name(
+        self,
+        realm: str | None,
+        internal_name: str,
+        *,
+        ini_ref: str,
+        inherit_from: Style | None = None,
+    ) -> Style:
+        """Return a style, given the parts of an already-split `ini_ref`."""
+        if not realm or not internal_name:
             logging.debug("Malformed %r", ini_ref)
             raise BadReferenceInRuleError
-        realm = mobj.group("realm").lower()
-        internal_name = mobj.group("internal_name")
-        try:
-            return next(
-                style
-                for style in self.styles.values()
-                if style.realm.lower() == realm and style.internal_name == internal_name
-            )
-        except StopIteration as exc:
-            if not inherit_from:
-                logging.debug("ERROR: Unknown %r", ini_ref)
-                raise BadReferenceInRuleError from exc
+        realm = realm.lower()
+        if style := self.styles_by_name.get((realm, internal_name)):
+            return style
+        if not inherit_from:
+            logging.debug("ERROR: Unknown %r", ini_ref)
+            raise BadReferenceInRuleError
         return self.add_style(
             realm=realm,
             wpid=ini_ref,
@@ -448,8 +504,8 @@ class WordProcessorToInDesignTaggedText:
             kwargs.setdefault("parent_wpid", self.base_names.get(realm))
 
         # Allow any special overrides (color, name, etc.)
-        with contextlib.suppress(KeyError):
-            kwargs.update(self.STYLE_OVERRIDE[realm][internal_name])
+        if overrides := self.STYLE_OVERRIDE.get((realm, internal_name)):
+            kwargs.update(overrides)
 
         section = self.settings.get_section(realm=realm, internal_name=internal_name)
         if not kwargs.get("name"):
@@ -478,46 +534,53 @@ class WordProcessorToInDesignTaggedText:
         kwargs.setdefault("name", kwargs["internal_name"])
 
         style = Style(**kwargs)
+        style.section_name = self.settings.fix_section_name(style=style)
         logging.debug("Created %s", style)
-        self.styles[self.style_key(style=style)] = style
+        self.styles[(style.realm, style.wpid)] = style
+        name_key = (style.realm_lc, style.internal_name)
+        self.styles_by_name.setdefault(name_key, style)
         return style
 
-    @classmethod
-    def style_key(cls, style=None, realm=None, wpid=None) -> str:
-        """Create the string which we use for `self.styles`.
-
-        Note that this is based on the wpid, because
-        that's the key docx files use for cross-reference.
-        """
-        if style:
-            realm = style.realm
-            wpid = style.wpid
-        return f"{realm}:{wpid}"
-
     def write_idtt(self) -> None:
         """Run the main conversion loop: parse document, write tagged text."""
         logging.info("Writing %s", self.output_fn)
+        self.chunk_converters = {}
         self.set_state(State())
         self.create_output()
-        with InDesignTaggedTextOutput(self.doc.properties) as self.writer:
-            self.define_styles()
-            self.convert_document()
-            self.write_output()
+        self.image_jobs_by_key = {}
+        self.image_jobs_started = []
+        self.formula_jobs = None  # Only started if there are many formulas
+        self.formulas_rendered = 0
+        try:
+            with (
+                concurrent.futures.ThreadPoolExecutor() as self.image_jobs,
+                InDesignTaggedTextOutput(self.doc.properties) as self.writer,
+            ):
+                self.define_styles()
+                self.convert_document()
+                self.write_output()
+                self.wait_for_image_jobs()
+        finally:
+            if self.formula_jobs is not None:
+                self.formula_jobs.shutdown()
 
     def create_output(self) -> None:
         """Create output directory, clean old image dirs."""
         self.output_dir.mkdir(parents=True, exist_ok=True)
         now = datetime.now()
         self.image_dir = self.output_dir / now.strftime("img-%Y%m%d-%H%M")
+        self.image_dir_created = False  # Only if there are any images
         if self.args.remove_old_images_if_indesign:
             remove_old = os.environ.get("__CFBundleIdentifier") == "com.adobe.InDesign"
         else:
             remove_old = self.args.remove_old_images
         if remove_old:
-            for path in self.output_dir.glob("img-????????-????"):
-                if path.is_dir():
-                    logging.debug("Removing %s", path)
-                    shutil.rmtree(path, ignore_errors=True)
+            # Must be done before we start writing, possibly to the same directory
+            with concurrent.futures.ThreadPoolExecutor() as pool:
+                for path in self.output_dir.glob("img-????????-????"):
+                    if path.is_dir():
+                        logging.debug("Removing %s", path)
+                        pool.submit(shutil.rmtree, path, ignore_errors=True)
 
     def convert_document(self) -> None:
         """Convert a document, one paragraph at a time."""
@@ -525,11 +588,13 @@ class WordProcessorToInDesignTaggedText:
             self.stop_marker_found = False
             self.state.is_post_empty = False
             self.state.is_post_break = False
+            convert_table = self.convert_table
+            convert_paragraph = self.convert_paragraph
             for node in self.doc.paragraphs():
                 if isinstance(node, IDocumentTable):
-                    self.convert_table(node)
+                    convert_table(node)
                 else:
-                    self.convert_paragraph(node)
+                    convert_paragraph(node)
             if self.stop_marker:
                 logging.info("Note: Stop marker was never found")
                 logging.debug("In other words, no %r", self.stop_marker)
@@ -544,12 +609,20 @@ class WordProcessorToInDesignTaggedText:
             text = text.replace("=", "\u05BE")
         if self.args.vav:
             text = text.replace("\u05D5\u05B9", "\uFB4B")
-        with Path(self.output_fn).open("w", encoding="UTF-16LE") as fobj:
-            fobj.write(text)
+        self.write_text_file(Path(self.output_fn), text, "UTF-16LE")
         if self.args.debug:
             utf8_fn = self.output_fn.with_suffix(".utf8")
-            with Path(utf8_fn).open("w", encoding="UTF-8") as fobj:
-                fobj.write(text)
+            self.write_text_file(Path(utf8_fn), text, "UTF-8")
+
+    def write_text_file(self, path: Path, text: str, encoding: str) -> None:
+        """Write a (possibly huge) string to a file.
+
+        Writing in slices keeps the encoder from making a full-size copy.
+        """
+        size = self.WRITE_SLICE_SIZE
+        with path.open("w", encoding=encoding, buffering=size) as fobj:
+            for start in range(0, len(text), size):
+                fobj.write(text[start:start + size])
 
     def convert_table(self, table: IDocumentTable) -> None:
         """Convert entire table."""
@@ -587,10 +660,18 @@ class WordProcessorToInDesignTaggedText:
 
         if self.stop_marker:
             self.check_for_stop_paragraph(para)
-        style = self.apply_rules_to(self.get_paragraph_style(para)) or default_style
+
+        # Materialized once; both the style and the conversion look at them
+        chunks = list(para.chunks())
+        spans = [chunk for chunk in chunks if isinstance(chunk, IDocumentSpan)]
+
+        style = self.get_paragraph_style(para, spans)
+        if self.rules_by_style:  # Usually there are none
+            style = self.apply_rules_to(style)
+        style = style or default_style
 
         self.writer.enter_paragraph(style)
-        for chunk in para.chunks():
+        for chunk in chunks:
             self.convert_chunk(chunk)
         if style and style.variable:
             self.define_variable_from_paragraph(style.variable, para)
@@ -609,8 +690,12 @@ class WordProcessorToInDesignTaggedText:
         self.state.is_post_empty = self.state.is_empty
         self.state.prev_para_style = style
 
-    def get_paragraph_style(self, para: IDocumentParagraph) -> OptionalStyle:
-        """Return style to be used for a paragraph."""
+    def get_paragraph_style(
+        self,
+        para: IDocumentParagraph,
+        spans: t.Sequence[IDocumentSpan],
+    ) -> OptionalStyle:
+        """Return style to be used for a paragraph, given its spans."""
         self.state.para_char_fmt = ManualFormat.NORMAL
 
         # The style object without any manual overrides
@@ -628,18 +713,19 @@ class WordProcessorToInDesignTaggedText:
             elif self.state.is_post_empty:
                 fmt = fmt | ManualFormat.SPACED
 
-            for span in para.spans():
-                for text in span.text():
-                    if text[0].isspace():
-                        fmt = fmt | ManualFormat.INDENTED
-                    break  # Just the first
-                break  # Just the first
+            if spans:
+                first = spans[0]
+                text = next(iter(first.text()), "")
+                if text[:1].isspace():
+                    fmt = fmt | ManualFormat.INDENTED
 
-            # Check for paragraph with a character style
-            char_fmts = {self.get_span_format(span) for span in para.spans()}
-            if len(char_fmts) == 1:
-                self.state.para_char_fmt = char_fmts.pop()
-                fmt = fmt | self.state.para_char_fmt
+                # Check for paragraph with a character style
+                mask = self.format_mask  # Inlined `get_span_format()`
+                char_fmt = first.format() & mask
+                others = itertools.islice(spans, 1, None)
+                if all(span.format() & mask == char_fmt for span in others):
+                    self.state.para_char_fmt = char_fmt
+                    fmt = fmt | char_fmt
 
         return self.get_manual_style("paragraph", unadorned, fmt)
 
@@ -672,7 +758,7 @@ class WordProcessorToInDesignTaggedText:
             return self.manual_styles[mfcs]
 
         if fmt:
-            fmtname = "_".join(f.name for f in ManualFormat if fmt & f and f.name)
+            fmtname = _fmt_name(fmt)
         else:
             fmtname = fmt.name or "DEFAULT"
             logging.debug("%r -> %r", fmt, fmtname)
@@ -696,18 +782,14 @@ class WordProcessorToInDesignTaggedText:
     def apply_rules_to(self, style: OptionalStyle) -> OptionalStyle:
         """Convert style according to user-defined rules."""
         if style:
-            for rule in self.rules:
+            for rule in self.rules_by_style.get(id(style), ()):
                 if self.rule_applies_to(rule, style):
                     rule.applied += 1
                     return rule.into_this_style
         return style
 
     def rule_applies_to(self, rule: Rule, style: Style) -> bool:
-        """Check if `rule` should be applied on `style`."""
-        if not rule.valid:
-            return False
-        if rule.turn_this_style is not style:
-            return False
+        """Check if `rule` (a rule for `style`) should be applied on it."""
         if rule.when_first_in_doc:
             if style.count > 1:
                 return False
@@ -718,15 +800,17 @@ class WordProcessorToInDesignTaggedText:
 
     def check_for_stop_paragraph(self, para: IDocumentParagraph) -> None:
         """Look for stop marker, raises StopMarkerFoundError() if found."""
-        text = ""
+        # Only the first len(stop_marker) characters are of interest
+        needed = len(self.stop_marker)
+        prefix = ""
         for chunk in para.text():
-            text += chunk
-            if text.startswith(self.stop_marker):
-                raise StopMarkerFoundError(
-                    "Stop marker found at the beginning of a paragraph",
-                )
-            if len(text) >= len(self.stop_marker):
-                return
+            prefix += chunk[:needed - len(prefix)]
+            if len(prefix) >= needed:
+                break
+        if prefix == self.stop_marker:
+            raise StopMarkerFoundError(
+                "Stop marker found at the beginning of a paragraph",
+            )
 
     def define_variable_from_paragraph(
         self,
@@ -734,9 +818,7 @@ class WordProcessorToInDesignTaggedText:
         para: IDocumentParagraph,
     ) -> None:
         """Save contents of a paragraph to a text variable."""
-        self.writer.define_text_variable(
-            variable, "".join(chunk for chunk in para.text()),
-        )
+        self.writer.define_text_variable(variable, "".join(para.text()))
 
     def set_state(self, state: State) -> State:
         """Set current style configuration, return previous one."""
@@ -749,12 +831,27 @@ class WordProcessorToInDesignTaggedText:
             chunk: IDocumentSpan | IDocumentImage | IDocumentFormula,
     ) -> None:
         """Convert all text and styles in a Span."""
-        if isinstance(chunk, IDocumentSpan):
-            self.convert_span(chunk)
-        elif isinstance(chunk, IDocumentImage):
-            self.convert_image(chunk)
-        elif isinstance(chunk, IDocumentFormula):
-            self.convert_formula(chunk)
+        kind = type(chunk)
+        if (convert := self.chunk_converters.get(kind)) is None:
+            convert = self.chunk_converters[kind] = self.find_chunk_converter(kind)
+        convert(chunk)
+
+    def find_chunk_converter(self, kind: type) -> t.Callable[[t.Any], None]:
+        """Return the method which converts a given type of chunk.
+
+        The `isinstance()` checks against the ABCs are slow, so
+        `convert_chunk()` only calls this once per type.
+        """
+        if issubclass(kind, IDocumentSpan):
+            return self.convert_span
+        if issubclass(kind, IDocumentImage):
+            return self.convert_image
+        if issubclass(kind, IDocumentFormula):
+            return self.convert_formula
+        return self.ignore_chunk
+
+    def ignore_chunk(self, chunk: object) -> None:
+        """Skip a chunk we don't know how to convert."""
 
     def convert_span(self, span: IDocumentSpan) -> None:
         """Convert all text and styles in a Span."""
@@ -785,9 +882,20 @@ class WordProcessorToInDesignTaggedText:
     def next_image_fn(self, infix: str, suffix: str) -> Path:
         """Generate next image filename."""
         count = next(self.image_count)
+        if not self.image_dir_created:
+            self.create_image_dir()
+        return self.image_dir / f"{self.output_stem}-{infix}-{count:03d}{suffix}"
+
+    def create_image_dir(self) -> None:
+        """Create the image directory, the first time an image is written."""
         self.image_dir.mkdir(parents=True, exist_ok=True)
-        name = f"{self.output_stem}-{infix}-{count:03d}{suffix}"
-        return self.image_dir / name
+        self.image_dir_created = True
+        if self.cache.hardlink:
+            # Rerunning within the same minute reuses the names; never write
+            # into an old file, which may be a link into the cache.
+            stale = f"{glob.escape(self.output_stem)}-*"
+            for old in self.image_dir.glob(stale):
+                old.unlink()
 
     def convert_image(self, img: IDocumentImage) -> None:
         """Save an image, keep a placeholder in the output."""
@@ -811,24 +919,55 @@ class WordProcessorToInDesignTaggedText:
 
         if suffix == ".emf" and not self.args.no_emf2svg:
             svg = path.with_suffix(".svg")
-            cached = self.cache.name(lambda: self.read_file(path), ".svg")
+            cached = self.cache.name_from_path(path, ".svg", key=img.cache_key())
+            if cached is not None:
+                self.wait_for_image_job(cached)  # Same image, still converting?
             if cached is not None and cached.is_file():
                 path = self.cache.get(cached, svg)
             else:
-                logging.debug("Converting %s -> %s", path.name, svg.name)
-                subprocess.run(
-                    [
-                        "emf2svg-conv",
-                        "-i", str(path),
-                        "-o", str(svg),
-                    ],
-                    check=True,
-                )
-                self.svg2png(svg, path)
+                self.start_image_job(cached, self.convert_emf, path, svg, cached)
                 path = svg
-                self.cache.put(path, cached)
         return path
 
+    def convert_emf(self, emf: Path, svg: Path, cached: Path | None) -> None:
+        """Convert an .emf image to .svg (and .png), then cache it."""
+        logging.debug("Converting %s -> %s", emf.name, svg.name)
+        subprocess.run(
+            [
+                _emf2svg_conv(),
+                "-i", str(emf),
+                "-o", str(svg),
+            ],
+            check=True,
+            close_fds=False,  # Our fds aren't inheritable anyway; allows posix_spawn
+        )
+        self.svg2png(svg, emf)
+        self.cache.put(svg, cached)
+
+    def start_image_job(
+        self, key: Path | None, func: t.Callable[..., None], *args: object,
+    ) -> None:
+        """Run slow image conversion in the background.
+
+        The output only refers to the images by path, so it doesn't have to wait.
+        """
+        future = self.image_jobs.submit(func, *args)
+        self.image_jobs_started.append(future)
+        if key is not None:
+            self.image_jobs_by_key[key] = future
+
+    def wait_for_image_job(self, key: Path) -> None:
+        """If a background job is creating `key`, wait for it to finish."""
+        if (future := self.image_jobs_by_key.pop(key, None)) is not None:
+            future.result()
+
+    def wait_for_image_jobs(self) -> None:
+        """Wait for all background jobs, raising any errors they had."""
+        for future in self.image_jobs_started:
+            future.result()
+        self.image_jobs_started.clear()
+        self.image_jobs_by_key.clear()
+
     def write_image_link(self, path: Path, style: Style) -> None:
         """Write an image placeholder."""
         prev = self.switch_character_style(style)
@@ -843,26 +982,61 @@ class WordProcessorToInDesignTaggedText:
         path = self.next_image_fn("formula", ".svg")
 
         cached = self.cache.name(get_contents=formula.raw, suffix=".svg")
+        if cached is not None:
+            self.wait_for_image_job(cached)  # Same formula, still converting?
         if cached is not None and cached.is_file():
             path = self.cache.get(cached, path)
         else:
             logging.debug("Converting -> %s", path.name)
             mathml = formula.mathml()
-
-            svg = MathConverter.mathml_to_svg(mathml, size=self.args.formula_font_size)
-            with path.open("wb") as fobj:
-                fobj.write(svg)
-
             if self.args.debug:
                 with path.with_suffix(".raw").open("wb") as fobj:
                     fobj.write(formula.raw())
                 with path.with_suffix(".mathml").open("w", encoding="utf-8") as fobj:
                     fobj.write(mathml)
-            self.svg2png(svg, path)
-            self.cache.put(path, cached)
+
+            svg = self.render_formula(mathml)
+            self.start_image_job(cached, self.save_formula, svg, path, cached)
 
         self.write_image_link(path, self.formula_style)
 
+    def render_formula(self, mathml: str) -> bytes | concurrent.futures.Future:
+        """Convert MathML to SVG, in other processes if there are many.
+
+        The conversion is pure Python, so threads wouldn't run it in parallel.
+        Spawned workers have to import everything again, though, which costs
+        more than rendering a few formulas; so the first ones are rendered
+        here, where an error also points at the formula which caused it.
+        Image jobs may be running in threads by now, so the workers are
+        spawned rather than forked from this (multithreaded) process.
+        """
+        from wp2tt.mathml import MathConverter  # Slow import
+
+        self.formulas_rendered += 1
+        if self.formulas_rendered <= self.FORMULAS_BEFORE_POOL:
+            return MathConverter.mathml_to_svg(mathml, self.args.formula_font_size)
+
+        if self.formula_jobs is None:
+            self.formula_jobs = concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.formula_jobs.submit(
+            MathConverter.mathml_to_svg, mathml, self.args.formula_font_size,
+        )
+
+    def save_formula(
+        self,
+        svg: bytes | concurrent.futures.Future,
+        path: Path,
+        cached: Path | None,
+    ) -> None:
+        """Write a converted formula (and its .png), then cache it."""
+        svg_bytes = svg if isinstance(svg, bytes) else svg.result()
+        with path.open("wb") as fobj:
+            fobj.write(svg_bytes)
+        self.svg2png(svg_bytes, path)
+        self.cache.put(path, cached)
+
     def svg2png(self, svg: Path | bytes, path_like: Path) -> None:
         """Convert SVG to png."""
         if self.args.no_svg2png:
@@ -871,26 +1045,37 @@ class WordProcessorToInDesignTaggedText:
             with svg.open("rb") as fobj:
                 svg = fobj.read()
         path = path_like.with_suffix(".png")
-        with path.open("wb") as fobj:
-            png = cairosvg.svg2png(svg)
-            if isinstance(png, bytes):
-                fobj.write(png)
-            else:
-                logging.warning("Cannot convert %s", path)
+        cached = self.cache.name(lambda: svg, ".png")
+        if cached is not None and cached.is_file():
+            self.cache.get(cached, path)
+            return
 
-    def read_file(self, path: str | os.PathLike) -> bytes:
-        """Read contents of a file."""
-        with Path(path).open("rb") as fobj:
-            return fobj.read()
+        import cairosvg  # Slow import
+        png = cairosvg.svg2png(svg)
+        if not isinstance(png, bytes):
+            logging.warning("Cannot convert %s", path)
+            return
+        with path.open("wb") as fobj:
+            fobj.write(png)
+        self.cache.put(path, cached)
 
     def convert_span_text(self, span: IDocumentSpan) -> None:
         """Convert text in a Span object."""
-        for text in span.text():
-            if self.state.is_empty and self.args.manual:
+        state = self.state
+        texts = iter(span.text())
+        for text in texts:
+            if not state.is_empty:
+                if self.stop_marker:  # Looked for in each piece on its own
+                    self.write_text(text)
+                    continue
+                # Nothing left to check, so write the rest of the span at once
+                self.write_text("".join(itertools.chain((text,), texts)))
+                return
+            if self.args.manual:
                 text = text.lstrip()
             self.write_text(text)
             if not text.isspace():
-                self.state.is_empty = False
+                state.is_empty = False
 
     def switch_character_style(self, style: OptionalStyle) -> OptionalStyle:
         """Set current character style."""
@@ -902,15 +1087,12 @@ class WordProcessorToInDesignTaggedText:
 
     def write_text(self, text: str) -> None:
         """Add some plain text."""
-        with contextlib.ExitStack() as stack:
-            stack.callback(lambda: self.do_write_text(text))
-            if not self.stop_marker:
-                return
+        if self.stop_marker:
             offset = text.find(self.stop_marker)
-            if offset < 0:
-                return
-            text = text[:offset]
-            raise StopMarkerFoundError("Stop marker found")
+            if offset >= 0:
+                self.do_write_text(text[:offset])
+                raise StopMarkerFoundError("Stop marker found")
+        self.do_write_text(text)
 
     def do_write_text(self, text: str) -> None:
         """Actually send text to `self.writer`."""
@@ -973,13 +1155,11 @@ class WordProcessorToInDesignTaggedText:
 
     def report_statistics(self) -> None:
         """Print a nice summary."""
-        realms = {s.realm for s in self.styles.values()}
-        for realm in realms:
-            logging.info(
-                "Number of %s styles used: %u",
-                realm.capitalize(),
-                sum(1 for s in self.styles.values() if s.realm == realm and s.used),
-            )
+        used_counts: collections.Counter[str] = collections.Counter()
+        for style in self.styles.values():
+            used_counts[style.realm] += style.used  # Still lists unused realms
+        for realm, count in used_counts.items():
+            logging.info("Number of %s styles used: %u", realm.capitalize(), count)
         for rule in self.rules:
             if rule.applied:
                 logging.info("%s application(s) of %s", rule.applied, rule)
@@ -989,42 +1169,79 @@ class WordProcessorToInDesignTaggedText:
         if not wpid:
             return None
 
-        style = self.styles[self.style_key(realm=realm, wpid=wpid)]
-        if realm in self.IGNORED_STYLES:
-            if style.internal_name in self.IGNORED_STYLES[realm]:
-                return None
+        style = self.styles[(realm, wpid)]
+        ignored = self.IGNORED_STYLES.get(realm)
+        if ignored and style.internal_name in ignored:
+            return None
 
-        self.activate_style(style)
+        if not style.activated:  # Skip the call for the common case
+            self.activate_style(style)
         style.count += 1
         return style
 
     def activate_style(self, style: Style) -> None:
-        """Define the style if needed."""
-        section_name = self.settings.fix_section_name(
-            realm=style.realm, internal_name=style.internal_name,
-        )
-        if section_name in self.style_sections_used:
+        """Define the style if needed.
+
+        Parents are activated before their children, and "next" styles
+        right after the style that leads to them.
+        """
+        if style.activated:
             return
 
-        if style.parent_style is not None:
-            if not style.parent_style.used:
-                logging.debug(
-                    "[%s] leads to missing %r",
-                    section_name,
-                    style.parent_wpid,
-                )
-                style.parent_style = self.base_styles[style.realm]
-                style.parent_wpid = style.parent_style.wpid
-            self.activate_style(style.parent_style)
+        # Each entry is (style, parents_done)
+        pending: list[tuple[Style, bool]] = [(style, False)]
+        expanded: set[str] = set()
+        while pending:
+            (style, parents_done) = pending.pop()
+            if style.activated:
+                continue
+            section_name = style.section_name
+            if section_name in self.style_sections_used:
+                style.activated = True  # Another style with the same section
+                continue
+
+            if not parents_done:
+                if section_name in expanded:
+                    continue  # Circular inheritance; already on the stack
+                expanded.add(section_name)
+                pending.append((style, True))
+                if (parent := self.parent_to_activate(style)) is not None:
+                    pending.append((parent, False))
+                continue
+
+            logging.debug("Activating %s", style)
+            self.settings.update_section(section_name, style)
+            self.style_sections_used.add(section_name)
+            style.activated = True
+
+            if (next_style := self.next_to_activate(style)) is not None:
+                pending.append((next_style, False))
 
-        logging.debug("Activating %s", style)
-        self.settings.update_section(section_name, style)
-        self.style_sections_used.add(section_name)
+    def parent_to_activate(self, style: Style) -> OptionalStyle:
+        """Return the parent of a style, replacing a missing one with the base."""
+        if style.parent_style is None:
+            return None
+        if not style.parent_style.used:
+            logging.debug(
+                "[%s] leads to missing %r",
+                style.section_name,
+                style.parent_wpid,
+            )
+            style.parent_style = self.base_styles[style.realm]
+            style.parent_wpid = style.parent_style.wpid
+        return style.parent_style
 
+    def next_to_activate(self, style: Style) -> OptionalStyle:
+        """Return the "next" style of a style, if it is used."""
         if style.next_style is not None and style.next_style.used:
-            self.activate_style(style.next_style)
-        elif style.next_wpid:
-            logging.debug("[%s] leads to missing %r", section_name, style.next_wpid)
+            return style.next_style
+        if style.next_wpid:
+            logging.debug(
+                "[%s] leads to missing %r",
+                style.section_name,
+                style.next_wpid,
+            )
+        return None
 
     @classmethod
     def quote_fn(cls, path: Path | str) -> str:
@@ -1,30 +1,88 @@
 """Caching directory for converted images, formulas, etc."""
 import hashlib
 import logging
+import os
 from pathlib import Path
 import shutil
+import tempfile
 
-from typing import Callable
+from collections.abc import Callable
+from collections.abc import Hashable
+from typing import Protocol
+
+
+class Hash(Protocol):
+    """What we need from a finished `hashlib` object."""
+
+    def hexdigest(self) -> str:
+        """Return the digest so far, in hex."""
 
 
 class Cache:
     """Caching directory for converted images, formulas, etc."""
 
-    def __init__(self, path: Path | None = None):
+    def __init__(self, path: Path | None = None, *, hardlink: bool = False):
         self.path = path
+        self.hardlink = hardlink
+        self._names: dict[tuple[Hashable, str], Path] = {}
 
     GetContents = Callable[[], bytes]
+    PREFIX = "b2-"  # Hash family, so old (MD5) entries never clash
+
+    def name(
+        self,
+        get_contents: GetContents,
+        suffix: str,
+        key: Hashable | None = None,
+    ) -> Path | None:
+        """Return where a converted version should be cached, if configured.
+
+        If given, `key` identifies the contents, which are then only read
+        and hashed the first time.
+        """
+        def get_hash() -> Hash:
+            hasher = self._new_hash()
+            hasher.update(get_contents())
+            return hasher
+
+        return self._name(get_hash, suffix, key)
+
+    def name_from_path(
+        self,
+        path: Path,
+        suffix: str,
+        key: Hashable | None = None,
+    ) -> Path | None:
+        """Like `name()`, but hash a file without reading it all into memory."""
+        def get_hash() -> Hash:
+            with path.open("rb") as fobj:
+                return hashlib.file_digest(fobj, self._new_hash)
+
+        return self._name(get_hash, suffix, key)
+
+    @staticmethod
+    def _new_hash() -> hashlib.blake2b:
+        return hashlib.blake2b(digest_size=16)
 
-    def name(self, get_contents: GetContents, suffix: str) -> Path | None:
-        """Return where a converted version should be cached, if configured"""
+    def _name(
+        self,
+        get_hash: Callable[[], Hash],
+        suffix: str,
+        key: Hashable | None,
+    ) -> Path | None:
         if self.path is None:
             return None
 
-        md5 = hashlib.md5(get_contents()).hexdigest()
-        return self.path / f"{md5}{suffix}"
+        if key is not None and (known := self._names.get((key, suffix))):
+            return known
+
+        cached = self.path / f"{self.PREFIX}{get_hash().hexdigest()}{suffix}"
+        if key is not None:
+            self._names[(key, suffix)] = cached
+        return cached
 
     def get(self, cached: Path, target: Path) -> Path:
-        """Uncache file, return location"""
+        """Uncache file, return location."""
         if self.path is None:
             return target
 
@@ -38,11 +96,11 @@ class Cache:
             target = target.with_suffix(final.suffix)
 
         logging.debug("Cached %s => %s", " -> ".join(descs), target.name)
-        shutil.copy(cached, target)
+        self._copy(cached, target)
         return target
 
     def put(self, source: Path, cached: Path | None) -> Path | None:
-        """Cache file, return location"""
+        """Cache file, return location."""
         if self.path is None:
             assert cached is None
             return source
@@ -50,5 +108,54 @@ class Cache:
         assert cached is not None
         logging.debug("Caching %s => %s", source.name, cached.name)
         cached.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy(source, cached)
+
+        # Conversions run in parallel; never let anyone see a partial file
+        fd, tmp = tempfile.mkstemp(dir=cached.parent, prefix=".", suffix=cached.suffix)
+        os.close(fd)
+        try:
+            self._copy(source, Path(tmp))
+            Path(tmp).replace(cached)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
         return cached
+
+    def _copy(self, source: Path, target: Path) -> None:
+        """Copy a file in or out of the cache, moving as few bytes as possible."""
+        if self.hardlink:
+            target.unlink(missing_ok=True)
+            try:
+                os.link(source, target)
+            except OSError as exc:  # E.g., different file systems
+                logging.debug("Cannot link %s => %s: %s", source, target, exc)
+            else:
+                return
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                self._copy_file_range(source, target)
+            except OSError as exc:
+                logging.debug("Cannot copy %s => %s: %s", source, target, exc)
+            else:
+                return
+
+        shutil.copy(source, target)
+
+    @classmethod
+    def _copy_file_range(cls, source: Path, target: Path) -> None:
+        """Copy without passing the data through user space.
+
+        Some file systems (e.g., Btrfs, XFS, NFS) may also share the blocks
+        instead of duplicating them, but that is up to the kernel.
+        """
+        with source.open("rb") as ifo, target.open("wb") as ofo:
+            size = os.fstat(ifo.fileno()).st_size
+            while size > 0:
+                copied = os.copy_file_range(ifo.fileno(), ofo.fileno(), size)
+                if copied <= 0:
+                    break
+                size -= copied
+            else:
+                shutil.copymode(source, target)
+                return
+        raise OSError(f"Short copy of {source}")
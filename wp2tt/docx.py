@@ -1,6 +1,9 @@
 """MS Word .docx parser."""
 
 import contextlib
+import functools
+import itertools
+import shutil
 import typing as t
 
 from pathlib import Path
@@ -24,6 +27,8 @@ from wp2tt.mathml import MathConverter
 from wp2tt.styles import DocumentProperties
 from wp2tt.zip import ZipDocument
 
+XPathExpr: t.TypeAlias = str | etree.XPath
+
 
 class WordXml:
     """Basic helper class for the Word XML format."""
@@ -45,43 +50,142 @@ class WordXml:
         "wp": _WP,
     }
 
+    # Expanded ("Clark") names, so hot loops don't rebuild them
+    _VAL = f"{{{_W}}}val"
+    _TYPE = f"{{{_W}}}type"
+    _ID = f"{{{_W}}}id"
+    _STYLE_ID = f"{{{_W}}}styleId"
+    _CUSTOM_STYLE = f"{{{_W}}}customStyle"
+    _BODY = f"{{{_W}}}body"
+    _P = f"{{{_W}}}p"
+    _TBL = f"{{{_W}}}tbl"
+    _TR = f"{{{_W}}}tr"
+    _TC = f"{{{_W}}}tc"
+    _TAB = f"{{{_W}}}tab"
+    _T = f"{{{_W}}}t"
+    _FOOTNOTE = f"{{{_W}}}footnote"
+    _COMMENT = f"{{{_W}}}comment"
+    _FOOTNOTE_REFERENCE = f"{{{_W}}}footnoteReference"
+    _COMMENT_REFERENCE = f"{{{_W}}}commentReference"
+    _DEL_PATH = f"{{{_W}}}pPr/{{{_W}}}rPr/{{{_W}}}del"
+    _PSTYLE_PATH = f"{{{_W}}}pPr/{{{_W}}}pStyle"
+    _RSTYLE_PATH = f"{{{_W}}}rPr/{{{_W}}}rStyle"
+    _TBL_STYLE_PATH = f"{{{_W}}}tblPr/{{{_W}}}tblStyle"
+    _GRID_SPAN_PATH = f"{{{_W}}}tcPr/{{{_W}}}gridSpan"
+    _NAME = f"{{{_W}}}name"
+    _BASED_ON = f"{{{_W}}}basedOn"
+    _NEXT = f"{{{_W}}}next"
+    _BIDI_VISUAL_PATH = f"{{{_W}}}tblPr/{{{_W}}}bidiVisual"
+    _TBL_HEADER_PATH = f"{{{_W}}}trPr/{{{_W}}}tblHeader"
+    _OMATH = f"{{{_M}}}oMath"
+    _PARA_ID = f"{{{_W14}}}paraId"
+    _EMBED = f"{{{_R}}}embed"
+    _DRAWING = f"{{{_W}}}drawing"
+    _EMBEDDED_BLIP_PATH = f".//{{{_A}}}blip[@{{{_R}}}embed]"
+    _RELATIONSHIP = f"{{{_REL}}}Relationship"
+    _PPR = f"{{{_W}}}pPr"
+    _RPR = f"{{{_W}}}rPr"
+    _JC = f"{{{_W}}}jc"
+    _BIDI = f"{{{_W}}}bidi"
+    _BOLD_TAGS = (f"{{{_W}}}b", f"{{{_W}}}bCs")
+    _ITALIC_TAGS = (f"{{{_W}}}i", f"{{{_W}}}iCs")
+    _VERT_ALIGN = f"{{{_W}}}vertAlign"
+    _POSITION = f"{{{_W}}}position"
+    _RTL = f"{{{_W}}}rtl"
+    _PARA_FORMAT_TAGS = (_JC, _BIDI)
+    _RTL_TAGS = (_BIDI, _RTL)
+    _FORMAT_BY_TAG: t.Mapping[str, ManualFormat] = {
+        **dict.fromkeys(_BOLD_TAGS, ManualFormat.BOLD),
+        **dict.fromkeys(_ITALIC_TAGS, ManualFormat.ITALIC),
+    }
+    _FORMAT_BY_VAL: t.Mapping[tuple[str, str | None], ManualFormat] = {
+        (_JC, "center"): ManualFormat.CENTERED,
+        (_JC, "both"): ManualFormat.JUSTIFIED,
+        (_VERT_ALIGN, "subscript"): ManualFormat.SUBSCRIPT,
+        (_VERT_ALIGN, "superscript"): ManualFormat.SUPERSCRIPT,
+    }
+    _CHAR_FORMAT_TAGS = (*_BOLD_TAGS, *_ITALIC_TAGS, _VERT_ALIGN, _POSITION)
+
+    @classmethod
+    def compile_xpath(cls, expr: str, *, smart_strings: bool = True) -> etree.XPath:
+        """Compile an XPath expression (with our namespaces) once, for reuse."""
+        return etree.XPath(expr, namespaces=cls._NS, smart_strings=smart_strings)
+
     @classmethod
     def xpath(
-        cls, nodes: list[etree._Entity] | etree._Entity, expr: str,
+        cls, nodes: list[etree._Entity] | etree._Entity, expr: XPathExpr,
     ) -> t.Iterable[etree._Entity]:
-        """Wrap etree.xpath, with namespaces and multiple nodes."""
-        if not isinstance(nodes, list):
-            nodes = [nodes]
-        for node in nodes:
-            yield from node.xpath(expr, namespaces=cls._NS)
+        """Wrap etree.xpath, with namespaces and multiple nodes.
 
-    @classmethod
-    def _mtag(cls, tag: str) -> str:
-        return f"{{{cls._M}}}{tag}"
+        Almost always there is a single node; then this is just one call.
+        """
+        if isinstance(expr, str):
+            expr = _compile_cached(expr)
+        if not isinstance(nodes, list):
+            return expr(nodes)
+        if len(nodes) == 1:
+            return expr(nodes[0])
+        return itertools.chain.from_iterable(expr(node) for node in nodes)
 
     @classmethod
+    @functools.cache
     def wtag(cls, tag: str) -> str:
         """Create representation of <w:XXX> tags."""
         return f"{{{cls._W}}}{tag}"
 
     @classmethod
-    def _w14tag(cls, tag: str) -> str:
-        return f"{{{cls._W14}}}{tag}"
+    def props_of(
+        cls, nodes: list[etree._Entity], container: str, *tags: str,
+    ) -> t.Iterable[etree._Entity]:
+        """Yield `tags` under each node's <w:pPr> or <w:rPr>, in a single pass."""
+        for node in nodes:
+            if (props := node.find(container)) is not None:
+                yield from props.iterchildren(*tags)
 
     @classmethod
-    def _rtag(cls, tag: str) -> str:
-        return f"{{{cls._R}}}{tag}"
+    def format_of_props(cls, props: t.Iterable[etree._Entity]) -> ManualFormat:
+        """Return manual formatting for property nodes from `props_of()`."""
+        fmt = ManualFormat.LTR
+        justified = False
+        for prop in props:
+            tag = prop.tag
+            if tag == cls._JC:
+                if justified:
+                    continue  # Only the first one counts
+                justified = True
+            if tag in cls._FORMAT_BY_TAG:
+                fmt |= cls._FORMAT_BY_TAG[tag]
+            elif tag in cls._RTL_TAGS:
+                fmt = fmt & ~ManualFormat.LTR | ManualFormat.RTL
+            elif tag == cls._POSITION:
+                fmt |= cls._format_of_position(prop)
+            else:  # <w:jc> or <w:vertAlign>
+                key = (tag, prop.get(cls._VAL))
+                fmt |= cls._FORMAT_BY_VAL.get(key, ManualFormat.NORMAL)
+        return fmt
 
     @classmethod
-    def _wval(
-        cls, nodes: list[etree._Entity] | etree._Entity, prop: str,
-    ) -> str | None:
-        if not isinstance(nodes, list):
-            nodes = [nodes]
-        for node in nodes:
-            for pnode in cls.xpath(node, prop):
-                return pnode.get(cls.wtag("val"))
-        return None
+    def _format_of_position(cls, prop: etree._Entity) -> ManualFormat:
+        """Return manual formatting for a <w:position> (raised/lowered text)."""
+        pval = float(prop.get(cls._VAL))
+        if pval < 0:
+            return ManualFormat.LOWERED
+        if pval > 0:
+            return ManualFormat.RAISED
+        return ManualFormat.NORMAL
+
+    @classmethod
+    def _wval(cls, node: etree._Entity, path: str) -> str | None:
+        """Return w:val of the first element at a (Clark notation) path."""
+        if (pnode := node.find(path)) is None:
+            return None
+        return pnode.get(cls._VAL)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_cached(expr: str) -> etree.XPath:
+    """Compile a string expression given to `WordXml.xpath()`, once."""
+    return WordXml.compile_xpath(expr)
 
 
 class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
@@ -90,6 +194,8 @@ class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
     _wpid_prefix: str | None = None
     _name_prefix: str | None = None
 
+    STYLE_XPATH = WordXml.compile_xpath("//w:style[@w:type][w:name[@w:val]]")
+
     def __init__(self, path: PathLike) -> None:
         super().__init__()
         self._read_docx(path)
@@ -101,17 +207,35 @@ class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
         self.footnotes = self.zip.load_xml("word/footnotes.xml")
         self.comments = self.zip.load_xml("word/comments.xml")
         self.relationships = self.zip.load_xml("word/_rels/document.xml.rels")
+        self.rel_targets: dict[str, PurePosixPath] = {}  # Id -> path in zip
+        if self.relationships is not None:
+            word = PurePosixPath("word")
+            for rel in self.relationships.iter(self._RELATIONSHIP):
+                self.rel_targets[rel.get("Id")] = word / rel.get("Target")
+        self.footnote_paras = self._index_paras(self.footnotes, self._FOOTNOTE)
+        self.comment_paras = self._index_paras(self.comments, self._COMMENT)
+
+    def _index_paras(
+        self, root: etree._Entity | None, tag: str,
+    ) -> dict[str, list[etree._Entity]]:
+        """Map w:id -> <w:p> nodes of each footnote/comment, so lookups are O(1)."""
+        paras: dict[str, list[etree._Entity]] = {}
+        if root is not None:
+            for node in root.iterchildren(tag):
+                if (nid := node.get(self._ID)) is not None:
+                    paras.setdefault(nid, []).extend(node.iterchildren(self._P))
+        return paras
 
     def _initialize_properties(self) -> None:
         self._properties = DocumentProperties(
-            has_rtl=self._has_node("w:rtl"),
+            has_rtl=self._has_node(self._RTL),
         )
 
-    def _has_node(self, wtag: str) -> bool:
+    def _has_node(self, tag: str) -> bool:
+        """Check for an element anywhere in the body, footnotes or comments."""
         for root in (self.document, self.footnotes, self.comments):
-            if root is not None:
-                for _ in self.xpath(root, wtag):
-                    return True
+            if root is not None and next(root.iter(tag), None) is not None:
+                return True
         return False
 
     @property
@@ -140,17 +264,18 @@ class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
     def styles_defined(self) -> t.Iterable[dict[str, t.Any]]:
         """Yield a Style object kwargs for every style defined in the document."""
         styles = self.zip.load_xml("word/styles.xml")
-        for stag in self.xpath(styles, "//w:style[@w:type][w:name[@w:val]]"):
-            fmt = DocxSpan.node_format(stag)
-            fmt &= ~(ManualFormat.LTR | ManualFormat.RTL)
-            fmt |= DocxParagraph.node_format(stag)
+        for stag in self.STYLE_XPATH(styles):
+            fmt = self.format_of_props(itertools.chain(  # Ignoring <w:rtl>
+                self.props_of([stag], self._PPR, *self._PARA_FORMAT_TAGS),
+                self.props_of([stag], self._RPR, *self._CHAR_FORMAT_TAGS),
+            ))
             yield {
-                "realm": stag.get(self.wtag("type")),
-                "internal_name": self.export_name(self._wval(stag, "w:name")),
-                "wpid": self.export_wpid(stag.get(self.wtag("styleId"))),
-                "parent_wpid": self.export_wpid(self._wval(stag, "w:basedOn")),
-                "next_wpid": self.export_wpid(self._wval(stag, "w:next")),
-                "custom": stag.get(self.wtag("customStyle")),
+                "realm": stag.get(self._TYPE),
+                "internal_name": self.export_name(self._wval(stag, self._NAME)),
+                "wpid": self.export_wpid(stag.get(self._STYLE_ID)),
+                "parent_wpid": self.export_wpid(self._wval(stag, self._BASED_ON)),
+                "next_wpid": self.export_wpid(self._wval(stag, self._NEXT)),
+                "custom": stag.get(self._CUSTOM_STYLE),
                 "fmt": fmt,
             }
 
@@ -159,8 +284,6 @@ class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
         "rStyle": "character",
         "tblStyle": "table",
     }
-    _TAG_EXPRS = " or ".join(f"self::w:{tag}" for tag in _TAG_TO_REALM)
-    TAG_XPATH = f"//*[{_TAG_EXPRS}]"
     WTAG_TO_REALM: t.Mapping[str, str] = {
         WordXml.wtag(tag): realm for tag, realm in _TAG_TO_REALM.items()
     }
@@ -170,15 +293,17 @@ class DocxInput(contextlib.ExitStack, WordXml, IDocumentInput):
         for node in (self.document, self.footnotes, self.comments):
             if node is None:
                 continue
-            for snode in self.xpath(node, self.TAG_XPATH):
-                wpid = self.export_wpid(snode.get(self.wtag("val")))
+            for snode in node.iter(*self.WTAG_TO_REALM):
+                wpid = self.export_wpid(snode.get(self._VAL))
                 yield (self.WTAG_TO_REALM[snode.tag], wpid)
 
     def paragraphs(self) -> t.Iterable["DocxParagraph | DocxTable"]:
         """Yield a DocxParagraph object for each body paragraph."""
         # ex. "//w:body/w:p[not(preceding-sibling::w:p/w:pPr/w:rPr/w:del)]"
-        for node in self.xpath(self.document, "//w:body/*[self::w:p or self::w:tbl]"):
-            if node.tag == self.wtag("tbl"):
+        if self.document is None or (body := self.document.find(self._BODY)) is None:
+            return
+        for node in body.iterchildren(self._P, self._TBL):
+            if node.tag == self._TBL:
                 yield DocxTable(self, node)
             elif not node.get("__wp2tt_skip__"):
                 yield DocxParagraph(self, node)
@@ -200,41 +325,48 @@ class DocxNode(WordXml):
         """Extend the list of nodes."""
         self.nodes.append(node)
 
-    def _node_wtag(self, tag: str) -> str | None:
-        return self.head_node.get(self.wtag(tag))
+    def _node_wid(self) -> str | None:
+        return self.head_node.get(self._ID)
 
-    def _node_xpath(self, expr: str) -> t.Iterable[etree._Entity]:
-        for node in self.nodes:
-            yield from node.xpath(expr, namespaces=self._NS)
-
-    def _node_wval(self, prop: str) -> str | None:
-        return self._node_wattr(prop, "val")
+    def _node_xpath(self, expr: XPathExpr) -> t.Iterable[etree._Entity]:
+        return self.xpath(self.nodes, expr)
 
-    def _node_wtype(self, prop: str) -> str | None:
-        return self._node_wattr(prop, "type")
+    def _node_children(self, *tags: str) -> t.Iterable[etree._Entity]:
+        """Like `_node_xpath()` for child tags, but without XPath."""
+        for node in self.nodes:
+            yield from node.iterchildren(*tags)
 
-    def _node_wtypes(self, prop: str) -> t.Iterable[str]:
-        yield from self._node_wattrs(prop, "type")
+    def _node_has(self, path: str) -> bool:
+        """Check for a (Clark notation) path under any of the nodes."""
+        return any(node.find(path) is not None for node in self.nodes)
 
-    def _node_wattr(self, prop: str, attr: str) -> str | None:
-        for value in self._node_wattrs(prop, attr):
-            return value
+    def _node_wval(self, path: str) -> str | None:
+        """Return the first w:val at a (Clark notation) path under the nodes."""
+        for node in self.nodes:
+            if (value := self._wval(node, path)) is not None:
+                return value
         return None
 
-    def _node_wattrs(self, prop: str, attr: str) -> t.Iterable[str]:
-        tag = self.wtag(attr)
-        for node in self.nodes:
-            for pnode in self.xpath(node, prop):
-                value = pnode.get(tag)
-                if value is not None:
-                    yield value
+    def _node_wtypes(self, prop: XPathExpr) -> t.Iterable[str]:
+        yield from self._node_wattrs(prop, self._TYPE)
+
+    def _node_wattrs(self, prop: XPathExpr, attr: str) -> t.Iterable[str]:
+        """Yield values of the (expanded) `attr` of nodes matching `prop`."""
+        for pnode in self.xpath(self.nodes, prop):
+            value = pnode.get(attr)
+            if value is not None:
+                yield value
 
 
 class DocxParagraph(DocxNode, IDocumentParagraph):
     """A Paragraph inside a .docx."""
 
-    R_XPATH = "w:r | w:ins/w:r | m:oMath"
-    T_XPATH = "w:r/w:t | w:ins/w:r/w:t"
+    R_XPATH = WordXml.compile_xpath("w:r | w:ins/w:r | m:oMath")
+    T_XPATH = WordXml.compile_xpath("w:r/w:t | w:ins/w:r/w:t")
+    T_TEXT_XPATH = WordXml.compile_xpath(
+        "w:r/w:t/text() | w:ins/w:r/w:t/text()", smart_strings=False,
+    )
+    BR_XPATH = WordXml.compile_xpath("w:r/w:br | w:ins/w:r/w:br")
     SNIPPET_LEN = 10
 
     def __init__(self, doc: DocxInput, para: etree._Entity) -> None:
@@ -251,34 +383,22 @@ class DocxParagraph(DocxNode, IDocumentParagraph):
 
     def _get_para_id(self, para: etree._Entity) -> str:
         """Create a hopefully unique paragraph ID."""
-        w14id = para.get(self._w14tag("paraId"))
+        w14id = para.get(self._PARA_ID)
         if w14id:
             return f'w14:paraId="{w14id}"'
 
-        texts: list[str] = []
-        tlen = 0
-        for tnode in para.xpath(self.T_XPATH, namespaces=self._NS):
-            text = tnode.text
-            if not text:  # May also be None
-                continue
-            texts.append(text)
-            tlen += len(text)
-            if tlen >= self.SNIPPET_LEN:
-                break
-        text = "".join(texts)
+        text = "".join(self.T_TEXT_XPATH(para))  # Joining in C beats stopping early
         if len(text) <= self.SNIPPET_LEN:
             return f'"{text}"'
         return f'"{text[:self.SNIPPET_LEN-3]}"...'
 
     def is_nonfinal(self, para: etree._Entity) -> bool:
         """Check if a <w:p> para has deleted, tracked newline."""
-        for _ in self.xpath(para, "./w:pPr/w:rPr/w:del"):
-            return True
-        return False
+        return para.find(self._DEL_PATH) is not None
 
     def style_wpid(self) -> str | None:
         """Get MS Word's internal ID for this style."""
-        return self.doc.export_wpid(self._node_wval("./w:pPr/w:pStyle"))
+        return self.doc.export_wpid(self._node_wval(self._PSTYLE_PATH))
 
     def text(self) -> t.Iterable[str]:
         """Yield strings of plain text."""
@@ -289,12 +409,13 @@ class DocxParagraph(DocxNode, IDocumentParagraph):
     def chunks(self) -> t.Iterable["DocxSpan | DocxImage | DocxFormula"]:
         """Yield DocxSpan per text span."""
         for node in self._node_xpath(self.R_XPATH):
-            if node.tag == self._mtag("oMath"):
+            if node.tag == self._OMATH:
                 yield DocxFormula(node)
             else:
-                for drawing in self.xpath(node, "w:drawing[//a:blip[@r:embed]]"):
-                    yield DocxImage(self.doc, drawing)
-                    break
+                for drawing in node.iterchildren(self._DRAWING):
+                    if drawing.find(self._EMBEDDED_BLIP_PATH) is not None:
+                        yield DocxImage(self.doc, drawing)
+                        break
                 else:
                     yield DocxSpan(self.doc, node)
 
@@ -304,20 +425,14 @@ class DocxParagraph(DocxNode, IDocumentParagraph):
 
     @classmethod
     def node_format(cls, nodes: list[etree._Entity]) -> ManualFormat:
-        """Return manual formatting on a paragraph/style."""
-        fmt = ManualFormat.LTR
-        justification = cls._wval(nodes, "w:pPr/w:jc")
-        if justification == "center":
-            fmt = fmt | ManualFormat.CENTERED
-        elif justification == "both":
-            fmt = fmt | ManualFormat.JUSTIFIED
-        for _ in cls.xpath(nodes, "w:pPr/w:bidi"):
-            fmt = (fmt & ~ManualFormat.LTR) | ManualFormat.RTL
-        return fmt
+        """Return manual formatting on a paragraph."""
+        return cls.format_of_props(
+            cls.props_of(nodes, cls._PPR, *cls._PARA_FORMAT_TAGS),
+        )
 
     def is_page_break(self) -> bool:
         """Check if the paragraph is a page break."""
-        for break_type in self._node_wtypes("w:r/w:br | w:ins/w:r/w:br"):
+        for break_type in self._node_wtypes(self.BR_XPATH):
             if break_type == "page":
                 return True
         return False
@@ -332,16 +447,16 @@ class DocxSpan(DocxNode, IDocumentSpan):
 
     def style_wpid(self) -> str | None:
         """Get this Span's style."""
-        return self.doc.export_wpid(self._node_wval("w:rPr/w:rStyle"))
+        return self.doc.export_wpid(self._node_wval(self._RSTYLE_PATH))
 
     def footnotes(self) -> t.Iterable["DocxFootnote"]:
         """Yield foornotes in this span."""
-        for fnr in self._node_xpath("w:footnoteReference"):
+        for fnr in self._node_children(self._FOOTNOTE_REFERENCE):
             yield DocxFootnote(self.doc, fnr)
 
     def comments(self) -> t.Iterable["DocxComment"]:
         """Yield foornotes in this span."""
-        for cmr in self._node_xpath("w:commentReference"):
+        for cmr in self._node_children(self._COMMENT_REFERENCE):
             yield DocxComment(self.doc, cmr)
 
     def format(self) -> ManualFormat:
@@ -350,58 +465,48 @@ class DocxSpan(DocxNode, IDocumentSpan):
 
     @classmethod
     def node_format(cls, nodes: list[etree._Entity]) -> ManualFormat:
-        """Get manual formatting for a span/style."""
-        fmt = ManualFormat.LTR
-        for _ in cls.xpath(nodes, "w:rPr/w:b | w:rPr/w:bCs"):
-            fmt = fmt | ManualFormat.BOLD
-        for _ in cls.xpath(nodes, "w:rPr/w:i | w:rPr/w:iCs"):
-            fmt = fmt | ManualFormat.ITALIC
-        for vnode in cls.xpath(nodes, "w:rPr/w:vertAlign"):
-            vval = vnode.get(cls.wtag("val"))
-            if vval == "subscript":
-                fmt |= ManualFormat.SUBSCRIPT
-            elif vval == "superscript":
-                fmt |= ManualFormat.SUPERSCRIPT
-        for vnode in cls.xpath(nodes, "w:rPr/w:position"):
-            vval = float(vnode.get(cls.wtag("val")))
-            if vval < 0:
-                fmt |= ManualFormat.LOWERED
-            elif vval > 0:
-                fmt |= ManualFormat.RAISED
-        for _ in cls.xpath(nodes, "w:rPr/w:rtl"):
-            fmt = fmt & ~ManualFormat.LTR | ManualFormat.RTL
-        return fmt
+        """Get manual formatting for a span."""
+        return cls.format_of_props(
+            cls.props_of(nodes, cls._RPR, *cls._CHAR_FORMAT_TAGS, cls._RTL),
+        )
 
-    def text(self) -> t.Iterable[str]:
-        """Yield chunks of text."""
-        for node in self._node_xpath("w:tab | w:t"):
-            if node.tag == self.wtag("tab"):
-                yield "\t"
-            elif node.text:
-                yield node.text
+    def text(self) -> list[str]:
+        """Return chunks of text (a list: runs are short, and mostly joined)."""
+        tab = self._TAB
+        return [
+            "\t" if node.tag == tab else node.text
+            for node in self._node_children(tab, self._T)
+            if node.tag == tab or node.text
+        ]
 
 
 class DocxImage(DocxNode, IDocumentImage):
     """An image inside a .docx."""
 
+    COPY_BUFSIZE = 1 << 20
+    DOC_PR_XPATH = WordXml.compile_xpath("./wp:inline/wp:docPr[@descr]")
+    BLIP_XPATH = WordXml.compile_xpath(".//a:blip[@r:embed]")
     descr: str | None = None
     target: PurePosixPath
 
     def __init__(self, doc: DocxInput, drawing: etree._Entity) -> None:
         super().__init__(doc, drawing)
-        for prop in self._node_xpath("./wp:inline/wp:docPr[@descr]"):
+        for prop in self._node_xpath(self.DOC_PR_XPATH):
             self.descr = prop.get("descr")
 
-        rels = self.doc.relationships
-        for blip in self._node_xpath(".//a:blip[@r:embed]"):
-            rid = blip.get(self._rtag("embed"))
-            for rel in self.doc.xpath(rels, f'//rel:Relationship[@Id="{rid}"]'):
-                self.target = PurePosixPath("word") / rel.get("Target")
+        for blip in self._node_xpath(self.BLIP_XPATH):
+            rid = blip.get(self._EMBED)
+            if (target := self.doc.rel_targets.get(rid)) is not None:
+                self.target = target
 
     def alt_text(self) -> str | None:
         """Get alt-text for image."""
         return self.descr
 
+    def cache_key(self) -> tuple[DocxInput, PurePosixPath]:
+        """Identify the image by its part in its file."""
+        return (self.doc, self.target)
+
     def suffix(self) -> str:
         """Get image suffix (file extension)."""
         return self.target.suffix
@@ -409,7 +514,7 @@ class DocxImage(DocxNode, IDocumentImage):
     def save(self, path: PathLike) -> None:
         """Extract image."""
         with self.doc.zip.open(str(self.target)) as ifo, Path(path).open("wb") as ofo:
-            ofo.write(ifo.read())
+            shutil.copyfileobj(ifo, ofo, self.COPY_BUFSIZE)
 
 
 class DocxFormula(IDocumentFormula):
@@ -417,16 +522,24 @@ class DocxFormula(IDocumentFormula):
 
     def __init__(self, node: etree._Entity) -> None:
         self.node = node
+        self._raw: bytes | None = None
 
     def raw(self) -> bytes:
         """Get formula's Word XML."""
-        return etree.tostring(self.node, pretty_print=True)
+        if self._raw is None:
+            self._raw = etree.tostring(self.node)
+        return self._raw
 
     def mathml(self) -> str:
-        """Convert formula to MathML."""
-        mathml = MathConverter.omml_to_mathml(self.node)
-        encoded = etree.tostring(mathml, pretty_print=True)
-        return encoded.decode()
+        """Convert formula to MathML (only once per distinct formula)."""
+        return _omml_to_mathml(self.raw())
+
+
+@functools.lru_cache(maxsize=256)
+def _omml_to_mathml(raw: bytes) -> str:
+    """Convert a formula's Word XML to MathML, remembering repeated ones."""
+    mathml = MathConverter.omml_to_mathml(etree.fromstring(raw))
+    return etree.tostring(mathml).decode()
 
 
 class DocxTable(DocxNode, IDocumentTable):
@@ -434,20 +547,18 @@ class DocxTable(DocxNode, IDocumentTable):
 
     def __init__(self, doc: DocxInput, node: etree._Entity) -> None:
         super().__init__(doc, node)
-        self.orows = [DocxTableRow(doc, row) for row in self.xpath(node, "./w:tr")]
+        self.orows = [DocxTableRow(doc, row) for row in node.iterchildren(self._TR)]
         self.n_header_rows = sum(row.is_header() for row in self.orows)
         self.n_rows = len(self.orows)
-        self.n_cols = max(
-            sum(cell.shape[1] for cell in row.cells()) for row in self.orows
-        )
+        self.n_cols = max(row.n_cols for row in self.orows)
 
     def style_wpid(self) -> str | None:
         """Return the wpid for this table's style."""
-        return self.doc.export_wpid(self._node_wval("w:tblPr/w:tblStyle"))
+        return self.doc.export_wpid(self._node_wval(self._TBL_STYLE_PATH))
 
     def format(self) -> ManualFormat:
         """Get table formatting (RTL is all we care about)."""
-        for _ in self._node_xpath("./w:tblPr/w:bidiVisual"):
+        if self._node_has(self._BIDI_VISUAL_PATH):
             return ManualFormat.RTL
         return ManualFormat.LTR
 
@@ -461,9 +572,9 @@ class DocxTable(DocxNode, IDocumentTable):
         """Return number of header rows."""
         return self.n_header_rows
 
-    def rows(self) -> t.Iterable["DocxTableRow"]:
-        """Iterate the rows of the table."""
-        yield from self.orows
+    def rows(self) -> list["DocxTableRow"]:
+        """Return the rows of the table."""
+        return self.orows
 
 
 class DocxTableRow(DocxNode, IDocumentTableRow):
@@ -471,26 +582,27 @@ class DocxTableRow(DocxNode, IDocumentTableRow):
 
     def __init__(self, doc: DocxInput, node: etree._Entity) -> None:
         super().__init__(doc, node)
-        self.ocells = [DocxTableCell(doc, cell) for cell in self.xpath(node, "./w:tc")]
+        self.ocells = [DocxTableCell(doc, cell) for cell in node.iterchildren(self._TC)]
+        self.n_cols = sum(cell.span for cell in self.ocells)  # Counting merged
 
     def is_header(self) -> bool:
         """Check if this row is a header row."""
-        for _ in self._node_xpath("./w:trPr/w:tblHeader"):
-            return True
-        return False
+        return self._node_has(self._TBL_HEADER_PATH)
 
-    def cells(self) -> t.Iterable["DocxTableCell"]:
-        """Yield all cells in the row."""
-        yield from self.ocells
+    def cells(self) -> list["DocxTableCell"]:
+        """Return all cells in the row."""
+        return self.ocells
 
 
 class DocxTableCell(DocxNode, IDocumentTableCell):
     """A table cell."""
 
+    _contents: DocxParagraph | None = None
+
     def __init__(self, doc: DocxInput, node: etree._Entity) -> None:
         super().__init__(doc, node)
         try:
-            self.span = int(self._wval(node, "./w:tcPr/w:gridSpan") or "1")
+            self.span = int(self._wval(node, self._GRID_SPAN_PATH) or "1")
         except ValueError:
             self.span = 1
 
@@ -501,9 +613,12 @@ class DocxTableCell(DocxNode, IDocumentTableCell):
 
     def contents(self) -> DocxParagraph:
         """Get the contents of this cell."""
-        for pnode in self.xpath(self.nodes, "./w:p"):
-            return DocxParagraph(self.doc, pnode)
-        raise RuntimeError("Table cell without a paragraph")
+        if self._contents is None:
+            pnode = self.head_node.find(self._P)
+            if pnode is None:
+                raise RuntimeError("Table cell without a paragraph")
+            self._contents = DocxParagraph(self.doc, pnode)
+        return self._contents
 
 
 class DocxFootnote(DocxNode, IDocumentFootnote):
@@ -511,8 +626,9 @@ class DocxFootnote(DocxNode, IDocumentFootnote):
 
     def paragraphs(self) -> t.Iterable[DocxParagraph]:
         """Yield DocxParagraph for each paragraph in a footnote."""
-        fnid = self._node_wtag("id")
-        for para in self.xpath(self.doc.footnotes, f'w:footnote[@w:id="{fnid}"]/w:p'):
+        if (wid := self._node_wid()) is None:
+            return
+        for para in self.doc.footnote_paras.get(wid, ()):
             yield DocxParagraph(self.doc, para)
 
 
@@ -521,6 +637,7 @@ class DocxComment(DocxNode, IDocumentComment):
 
     def paragraphs(self) -> t.Iterable[DocxParagraph]:
         """Yield DocxParagraph for each paragraph in a comment."""
-        cmid = self._node_wtag("id")
-        for para in self.xpath(self.doc.comments, f'w:comment[@w:id="{cmid}"]/w:p'):
+        if (wid := self._node_wid()) is None:
+            return
+        for para in self.doc.comment_paras.get(wid, ()):
             yield DocxParagraph(self.doc, para)
@@ -1,8 +1,11 @@
 """Ini file helper."""
 import configparser
 import dataclasses as dcl
+import functools
+import io
 import logging
 from pathlib import Path
+import re
 import shutil
 import typing as t
 
@@ -14,6 +17,97 @@ from wp2tt.styles import Style
 
 
 ConfigSection = (configparser.SectionProxy | dict[str, str])
+IniSections = dict[str, dict[str, str]]
+
+SECTION_RE = re.compile(r"\[(?P<name>.+)\]")
+KEY_VALUE_RE = re.compile(r"(?P<key>.*?)\s*[=:]\s*(?P<value>.*)$")
+COMMENT_PREFIXES = ("#", ";")
+
+
+def parse_ini(text: str, source: str = "<string>") -> IniSections:
+    """Parse .ini file contents into {section name: {key: value}}.
+
+    This follows `configparser.ConfigParser`'s default dialect (full-line
+    comments, "=" or ":" delimiters, lowercase keys, indented continuation
+    lines, strict about repetitions) without its per-line overhead,
+    and raises the same exceptions.
+    """
+    sections: dict[str, dict[str, list[str]]] = {}
+    section: dict[str, list[str]] | None = None
+    section_name = ""
+    lines: list[str] | None = None  # Of the current value
+    indent = 0
+    for lineno, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped:
+            if lines is not None:
+                lines.append("")  # Maybe an empty line inside a multiline value
+            continue
+        if stripped.startswith(COMMENT_PREFIXES):
+            continue
+
+        curr_indent = len(line) - len(line.lstrip())
+        if lines is not None and curr_indent > indent:
+            lines.append(stripped)  # Continuation line
+            continue
+
+        indent = curr_indent
+        lines = None
+        if mobj := SECTION_RE.match(stripped):
+            section_name = mobj.group("name")
+            section = _enter_section(sections, section_name, source, lineno)
+        elif section is None:
+            raise configparser.MissingSectionHeaderError(source, lineno, line)
+        elif (mobj := KEY_VALUE_RE.match(stripped)) and mobj.group("key"):
+            key = mobj.group("key").lower()
+            if key in section:
+                raise configparser.DuplicateOptionError(
+                    section_name, key, source, lineno,
+                )
+            lines = section[key] = [mobj.group("value")]
+        else:
+            error = configparser.ParsingError(source)
+            error.append(lineno, repr(line))
+            raise error
+
+    return {
+        name: {key: "\n".join(value).rstrip() for key, value in values.items()}
+        for name, values in sections.items()
+    }
+
+
+def _enter_section(
+    sections: dict[str, dict[str, list[str]]],
+    name: str,
+    source: str,
+    lineno: int,
+) -> dict[str, list[str]]:
+    """Return a new section; only DEFAULT may appear more than once."""
+    if name not in sections:
+        sections[name] = {}
+    elif name != configparser.DEFAULTSECT:
+        raise configparser.DuplicateSectionError(name, source, lineno)
+    return sections[name]
+
+
+@functools.cache
+def ini_fields(klass: type, *, writeable: bool = False) -> tuple[tuple[str, str], ...]:
+    """Return pairs (name, ini_name) for all attributes of a dataclass.
+
+    Cached, since the answer never changes and this is called per style.
+    """
+    pairs = []
+    for field in dcl.fields(klass):
+        special = field.metadata.get(ATTR_KEY)
+        if special == ATTR_VALUE_HIDDEN:
+            continue
+        ini_name = name = field.name
+        if special == ATTR_VALUE_READONLY:
+            if writeable:
+                continue
+            ini_name += " (readonly)"
+        pairs.append((name, ini_name))
+    return tuple(pairs)
 
 
 class SettingsFile(configparser.ConfigParser):
@@ -30,7 +124,7 @@ class SettingsFile(configparser.ConfigParser):
 
     def __init__(self, path: Path, *, fresh_start: bool = False) -> None:
         """Read ini file."""
-        super().__init__()
+        super().__init__(interpolation=None)  # We never use "%(name)s"
         self.path = path
         self.base = self.path.parent.resolve()
 
@@ -38,7 +132,7 @@ class SettingsFile(configparser.ConfigParser):
             return
 
         logging.info("Reading %s", self.path)
-        self.read(path, encoding=self.ENCODING)
+        self.read_fast()
         try:
             self.images = self[self.IMAGE_SECTION]
             self.base = self.base / self.images[self.BASE_KEY]
@@ -46,6 +140,12 @@ class SettingsFile(configparser.ConfigParser):
         except KeyError:
             pass
 
+    def read_fast(self) -> None:
+        """Read the ini file, bypassing `configparser`'s (slow) parsing."""
+        source = str(self.path)
+        with self.path.open(encoding=self.ENCODING) as fobj:
+            self.read_dict(parse_ini(fobj.read(), source=source), source=source)
+
     def exists(self) -> bool:
         """Check if the .ini file currently exists."""
         return self.path.is_file()
@@ -71,27 +171,46 @@ class SettingsFile(configparser.ConfigParser):
     def fields(
         self, klass: type, *, writeable: bool = False,
     ) -> t.Iterable[tuple[str, str]]:
-        """Yield a pair (name, ini_name) for all attributes."""
-        for field in dcl.fields(klass):
-            special = field.metadata.get(ATTR_KEY)
-            if special == ATTR_VALUE_HIDDEN:
-                continue
-            ini_name = name = field.name
-            if special == ATTR_VALUE_READONLY:
-                if writeable:
-                    continue
-                ini_name += " (readonly)"
-            yield (name, ini_name)
+        """Return pairs (name, ini_name) for all attributes."""
+        return ini_fields(klass, writeable=writeable)
 
     def backup_and_write(self) -> None:
-        """Write to disk, backing up first if modified."""
-        if self.touched and self.exists():
-            logging.debug("Backing up %s", self.path)
-            shutil.copy(self.path, self.path.with_suffix(".bak"))
+        """Write to disk, backing up first if modified.
+
+        If the file already has exactly these contents, leave it alone.
+        """
+        contents = self.dumps()
+        if self.exists():
+            if self.path.read_text(encoding=self.ENCODING) == contents:
+                logging.info("No changes to %s", self.path)
+                return
+            if self.touched:
+                logging.debug("Backing up %s", self.path)
+                shutil.copy(self.path, self.path.with_suffix(".bak"))
 
         logging.info("Writing %s", self.path)
         with self.path.open("w", encoding=self.ENCODING) as fobj:
-            self.write(fobj)
+            fobj.write(contents)
+
+    def dumps(self) -> str:
+        """Return the ini file contents.
+
+        Same format as `configparser.ConfigParser.write()`, but built
+        directly instead of going through its per-line machinery.
+        """
+        if self.defaults():  # Rare; let `configparser` tell what's inherited
+            buffer = io.StringIO()
+            self.write(buffer)
+            return buffer.getvalue()
+
+        parts: list[str] = []
+        for section_name in self.sections():
+            parts.append(f"[{section_name}]\n")
+            for key, value in self.items(section_name, raw=True):
+                text = str(value).replace("\n", "\n\t")
+                parts.append(f"{key} = {text}\n")
+            parts.append("\n")
+        return "".join(parts)
 
     def get_section(
         self,
@@ -141,12 +260,14 @@ class SettingsFile(configparser.ConfigParser):
         """
         section = self.ensure_section(section_name)
         for name, ini_name in self.fields(Style):
-            value = getattr(style, name)
-            self.touched |= section.get(ini_name) != value
-            if value:
-                section[ini_name] = str(value or "")
-            else:
+            if value := getattr(style, name):
+                value = str(value)
+                if section.get(ini_name) != value:
+                    section[ini_name] = value
+                    self.touched = True
+            elif ini_name in section:
                 section.pop(ini_name, None)
+                self.touched = True
 
     @classmethod
     def fix_section_name(
@@ -166,6 +287,8 @@ class SettingsFile(configparser.ConfigParser):
             return section_name
 
         if style:
+            if style.section_name:  # Already computed once
+                return style.section_name
             realm = style.realm
             internal_name = style.internal_name
         if realm:
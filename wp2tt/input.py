@@ -104,6 +104,10 @@ class IDocumentImage(ABC):
         """Get alternative text, if it exists."""
         return None
 
+    def cache_key(self) -> t.Hashable | None:
+        """Something which identifies the image contents, if possible."""
+        return None
+
     @abstractmethod
     def suffix(self) -> str:
         """Extension (e.g., ".jpeg")."""
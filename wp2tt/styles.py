@@ -14,7 +14,7 @@ ATTR_NO_INI = {ATTR_KEY: ATTR_VALUE_HIDDEN}
 OptionalStyle = Union["Style", None]
 
 
-@dcl.dataclass
+@dcl.dataclass(slots=True)
 class Style:
     """A character/paragraph style, normally found in the input file."""
 
@@ -32,6 +32,13 @@ class Style:
 
     used: bool = dcl.field(default=False, metadata=ATTR_NO_INI, compare=False)
     count: int = dcl.field(default=0, metadata=ATTR_NO_INI, compare=False)
+    activated: bool = dcl.field(default=False, metadata=ATTR_NO_INI, compare=False)
+    section_name: str = dcl.field(  # Name of the ini section, set once on creation
+        default="", metadata=ATTR_NO_INI, compare=False, repr=False,
+    )
+    realm_lc: str = dcl.field(  # Lowercase `realm`, for lookups
+        init=False, metadata=ATTR_NO_INI, compare=False, repr=False,
+    )
 
     parent_style: OptionalStyle = dcl.field(
         default=None, metadata=ATTR_NO_INI, compare=False,
@@ -40,6 +47,9 @@ class Style:
         default=None, metadata=ATTR_NO_INI, compare=False,
     )
 
+    def __post_init__(self) -> None:
+        self.realm_lc = self.realm.lower()
+
     def __str__(self) -> str:
         if self.custom:
             return f"<{self.realm} {self.name!r}"
@@ -49,7 +59,7 @@ class Style:
         return hash(f"{self.realm}:{self.name}")
 
 
-@dcl.dataclass
+@dcl.dataclass(slots=True)
 class Rule:
     """A derivation rule for Styles."""
 
@@ -62,7 +72,7 @@ class Rule:
 
     turn_this_style: OptionalStyle = dcl.field(default=None, metadata=ATTR_NO_INI)
     into_this_style: OptionalStyle = dcl.field(default=None, metadata=ATTR_NO_INI)
-    when_following_styles: list[Style] | None = dcl.field(
+    when_following_styles: frozenset[Style] | None = dcl.field(
         default=None, metadata=ATTR_NO_INI,
     )
 
@@ -3,6 +3,7 @@ from argparse import Action
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from argparse import Namespace
+from collections.abc import Iterator
 import logging
 import os
 from pathlib import Path
@@ -19,6 +20,21 @@ class Wp2ttParser(ArgumentParser):
     """ArgumentParser for this program."""
     SPECIAL_GROUP = "(autogenerated)"
     DEFAULT_BASE = SPECIAL_GROUP + "/(Basic Style)"
+    RERUNNER_FLAGS = (
+        "convert_comments",
+        "debug",
+        "manual",
+        "manual_light",
+        "maqaf",
+        "no_cache",
+        "no_emf2svg",
+        "no_input_rerunner",
+        "no_rerunner",
+        "no_svg2png",
+        "remove_old_images",
+        "remove_old_images_if_indesign",
+        "vav",
+    )
 
     def __init__(self):
         super().__init__(
@@ -166,6 +182,13 @@ class Wp2ttParser(ArgumentParser):
             type=Path,
             help="Cache directory for converted files like SVG",
         )
+        self.add_argument(
+            "--cache-mode",
+            choices=["copy", "hardlink"],
+            default="copy",
+            help="How to get files in and out of the cache (hardlink saves space"
+            " and time, but the images then share storage with the cache)",
+        )
         group = self.add_mutually_exclusive_group()
         group.add_argument(
             "--remove-old-images",
@@ -188,92 +211,76 @@ class Wp2ttParser(ArgumentParser):
     def write_rerunner(self, rerunner: Path, args: Namespace):
         """Write script to rerun the program"""
         logging.info("Writing %s", rerunner)
+        cli = " ".join(self._rerunner_cli(rerunner, args))
         with open(rerunner, "w", encoding="UTF-8") as fobj:
-            fobj.write("#!/bin/bash\n# AUTOGENERATED FILE, DO NOT EDIT.\n\n")
-            progname = os.environ.get("VRAPPED", sys.argv[0])
-            cli = [
-                self._quote(progname),
-                self._quote(args.input),
-            ]
-            if args.output:
-                cli.append(self._quote(args.output))
-            cli.append('"$@"')  # Has to come before the dashes
-            self._add_str(cli, args, "stop_at")
-            self._add_str(cli, args, "base_character_style", self.DEFAULT_BASE)
-            self._add_str(cli, args, "base_paragraph_style", self.DEFAULT_BASE)
-            self._add_path(cli, args, "cache")
-            self._add_flag(cli, args, "convert_comments")
-            self._add_flag(cli, args, "debug")
-            self._add_flag(cli, args, "manual")
-            self._add_flag(cli, args, "manual_light")
-            self._add_flag(cli, args, "maqaf")
-            self._add_flag(cli, args, "no_cache")
-            self._add_flag(cli, args, "no_emf2svg")
-            self._add_flag(cli, args, "no_input_rerunner")
-            self._add_flag(cli, args, "no_rerunner")
-            self._add_flag(cli, args, "no_svg2png")
-            self._add_flag(cli, args, "remove_old_images")
-            self._add_flag(cli, args, "remove_old_images_if_indesign")
-            self._add_flag(cli, args, "vav")
-            if args.comment_prefix:
-                cli.append("--comment-prefix")
-                cli.append(shlex.quote(args.comment_prefix))
-            if args.formula_font_size:
-                cli.append("--formula-font-size")
-                cli.append(str(args.formula_font_size))
-            if args.max_table_cols:
-                cli.append("--max-table-cols")
-                cli.append(str(args.max_table_cols))
-            elif args.table_cols:
-                cli.append("--table-cols")
-                cli.append(",".join(str(col) for col in args.table_cols))
-            if args.append:
-                cli.append("--append")
-                cli.extend([self._quote(path) for path in args.append])
-            if args.style_to_variable:
-                cli.append("--style-to-variable")
-                cli.extend(
-                    shlex.quote(f"{k}={v}")
-                    for k, v in args.style_to_variable.items()
-                )
-            log_fn = Path(f"{rerunner}.output")
-            cli.append("2>&1")
-            cli.append("|tee")
-            cli.append(str(log_fn.absolute()))
-            fobj.write(" ".join(map(str, cli)))
-            fobj.write("\n")
+            fobj.write(f"#!/bin/bash\n# AUTOGENERATED FILE, DO NOT EDIT.\n\n{cli}\n")
         rerunner.chmod(0o755)
 
-    @classmethod
-    def _add_flag(cls, cli: list[str], args: Namespace, name: str):
-        """Helper to add a flag if it was set"""
-        if getattr(args, name):
-            cli.append(cls._argify(name))
+    def _rerunner_cli(self, rerunner: Path, args: Namespace) -> Iterator[str]:
+        """Yield the words of the rerunner command line"""
+        yield self._quote(os.environ.get("VRAPPED", sys.argv[0]))
+        yield self._quote(args.input)
+        if args.output:
+            yield self._quote(args.output)
+        yield '"$@"'  # Has to come before the dashes
+        yield from self._str_arg(args, "stop_at")
+        yield from self._str_arg(args, "base_character_style", self.DEFAULT_BASE)
+        yield from self._str_arg(args, "base_paragraph_style", self.DEFAULT_BASE)
+        yield from self._path_arg(args, "cache")
+        yield from self._str_arg(args, "cache_mode", "copy")
+        for name in self.RERUNNER_FLAGS:
+            if getattr(args, name):
+                yield self._argify(name)
+        yield from self._rerunner_values(args)
+        yield "2>&1"
+        yield "|tee"
+        yield str(Path(f"{rerunner}.output").absolute())
+
+    def _rerunner_values(self, args: Namespace) -> Iterator[str]:
+        """Yield the rerunner's options which take specially formatted values."""
+        if args.comment_prefix:
+            yield "--comment-prefix"
+            yield shlex.quote(args.comment_prefix)
+        if args.formula_font_size:
+            yield "--formula-font-size"
+            yield str(args.formula_font_size)
+        if args.max_table_cols:
+            yield "--max-table-cols"
+            yield str(args.max_table_cols)
+        elif args.table_cols:
+            yield "--table-cols"
+            yield ",".join(str(col) for col in args.table_cols)
+        if args.append:
+            yield "--append"
+            yield from map(self._quote, args.append)
+        if args.style_to_variable:
+            yield "--style-to-variable"
+            for key, value in args.style_to_variable.items():
+                yield shlex.quote(f"{key}={value}")
 
     @classmethod
-    def _add_path(cls, cli: list[str], args: Namespace, name: str):
-        """Helper to add a path if it was set"""
+    def _path_arg(cls, args: Namespace, name: str) -> Iterator[str]:
+        """Yield a path argument, if it was set."""
         if (value := getattr(args, name)):
-            cli.append(cls._argify(name))
-            cli.append(cls._quote(value))
+            yield cls._argify(name)
+            yield cls._quote(value)
 
     @classmethod
-    def _add_str(
+    def _str_arg(
         cls,
-        cli: list[str],
         args: Namespace,
         name: str,
         default: str | None = None,
-    ):
-        """Helper to add a string if it was set"""
+    ) -> Iterator[str]:
+        """Yield a string argument, if it differs from the default."""
         value = getattr(args, name)
         if default is None:
             if not value:
                 return
         elif value == default:
             return
-        cli.append(cls._argify(name))
-        cli.append(shlex.quote(value))
+        yield cls._argify(name)
+        yield shlex.quote(value)
 
     @classmethod
     def _argify(cls, name):
@@ -7,10 +7,13 @@ from lxml import etree
 class ZipDocument(zipfile.ZipFile):
     """Base class for zipped-xml, like .docx and .odt"""
 
+    # We never look nodes up by xml:id, so don't index them
+    PARSER = etree.XMLParser(collect_ids=False)
+
     def load_xml(self, path_in_zip: str) -> etree._Entity | None:
         """Parse an XML file inside the zipped doc, return root node."""
         try:
             with self.open(path_in_zip) as fobj:
-                return etree.parse(fobj).getroot()
+                return etree.parse(fobj, self.PARSER).getroot()
         except KeyError:
             return None